@@ -1,35 +1,111 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
+from sqlalchemy import func, select, cast, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import SQLAlchemyError
+import hashlib
+import time
 
-from models import setup_db, Question, Category
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+from models import setup_db, Question, Category, db, trgm_enabled
 
 QUESTIONS_PER_PAGE = 10
 
+# Column projection for the read endpoints: fetching plain tuples and zipping
+# them into dicts skips ORM entity construction entirely. Mutating endpoints
+# keep the ORM path.
+_QUESTION_FIELDS = ("id", "question", "answer", "category", "difficulty")
+_QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                     Question.category, Question.difficulty)
+
+# Built once; after_request extends every response with these in one call.
+_EXTRA_HEADERS = [
+  ("Access-Control-Allow-Headers", "Content-Type,Authorization,true"),
+  ("Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS"),
+]
+
+
+def json_response(payload):
+  # orjson encodes straight to UTF-8 bytes in C, several times faster than
+  # the stdlib encoder jsonify goes through; fall back if it is missing.
+  if orjson is None:
+    return jsonify(payload)
+
+  # OPT_NON_STR_KEYS stringifies the int category ids the same way the
+  # stdlib encoder does, so both paths emit identical JSON.
+  return current_app.response_class(
+      orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS),
+      mimetype="application/json")
 
-def paginate_questions(request, selection):
-  page = request.args.get("page", 1, type=int)
-  start = (page - 1) * QUESTIONS_PER_PAGE
-  end = start + QUESTIONS_PER_PAGE
 
-  questions = [question.format() for question in selection]
-  current_questions = questions[start:end]
+def escape_like(term):
+  # Escape LIKE metacharacters so user input matches literally instead of
+  # acting as wildcards inside the %...% pattern.
+  return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def paginate_questions(request, selection):
+  selection = selection.with_entities(*_QUESTION_COLUMNS)
+  after_id = request.args.get("after_id", type=int)
+
+  if after_id is not None:
+    # Keyset pagination: seek past the cursor on the id index instead of
+    # an OFFSET scan that slows down linearly with page depth. The cursor
+    # only makes sense in id order, so any caller ordering is overridden.
+    rows = (selection.order_by(None).order_by(Question.id)
+            .filter(Question.id > after_id).limit(QUESTIONS_PER_PAGE).all())
+  else:
+    page = request.args.get("page", 1, type=int)
+    start = (page - 1) * QUESTIONS_PER_PAGE
+    rows = selection.limit(QUESTIONS_PER_PAGE).offset(start).all()
+
+  current_questions = [dict(zip(_QUESTION_FIELDS, row)) for row in rows]
 
   return current_questions
 
+# Categories change rarely but are fetched on almost every request, so the
+# lookup is memoized in-process for a short TTL.
+_CATEGORIES_CACHE = {"data": None, "ts": 0.0}
+_CATEGORIES_TTL = 300
+
 def get_categories():
-  selection = Category.query.order_by(Category.id).all()
-  categories = {category.id:category.type for category in selection}
+  if (_CATEGORIES_CACHE["data"] is not None
+      and time.monotonic() - _CATEGORIES_CACHE["ts"] < _CATEGORIES_TTL):
+    return _CATEGORIES_CACHE["data"]
+
+  rows = db.session.query(Category.id, Category.type).order_by(Category.id).all()
+  categories = dict(rows)
+
+  _CATEGORIES_CACHE["data"] = categories
+  _CATEGORIES_CACHE["ts"] = time.monotonic()
 
   return categories
 
+def invalidate_categories():
+  _CATEGORIES_CACHE["data"] = None
+  _CATEGORIES_CACHE["ts"] = 0.0
+
 
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  # Pool connections so concurrent request threads reuse them instead of
+  # opening a fresh PG connection per request.
+  app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+    # Kill any query stuck past 5s so a slow statement can't pin a pooled
+    # connection indefinitely.
+    "connect_args": {"options": "-c statement_timeout=5000"},
+  }
   setup_db(app)
   
   '''
@@ -43,13 +119,8 @@ def create_app(test_config=None):
   # CORS Headers
   @app.after_request
   def after_request(response):
-      response.headers.add(
-          "Access-Control-Allow-Headers", "Content-Type,Authorization,true"
-      )
-      response.headers.add(
-          "Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS"
-      )
-      return response 
+      response.headers.extend(_EXTRA_HEADERS)
+      return response
       
   '''
   @TODO: 
@@ -58,13 +129,23 @@ def create_app(test_config=None):
   '''
   @app.route('/categories')
   def retrive_categories():
-    return jsonify(
+    response = json_response(
         {
           "success": True,
           "categories": get_categories(),
         }
       )
 
+    # Categories rarely change, so let clients revalidate with an ETag and
+    # cache the payload for a few minutes.
+    etag = hashlib.md5(response.get_data()).hexdigest()
+    if request.if_none_match and etag in request.if_none_match:
+      return "", 304, {"ETag": etag, "Cache-Control": "public, max-age=300"}
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return response
+
 
 
   '''
@@ -81,25 +162,44 @@ def create_app(test_config=None):
   '''
   @app.route('/questions')
   def retrive_questions():
-    selection = Question.query.order_by(Question.id).all()
-    current_questions = paginate_questions(request, selection)
+    after_id = request.args.get("after_id", type=int)
+
+    if after_id is None:
+      # Attach a window count to the page query so the rows and the total
+      # come back in a single round-trip; with the categories cache warm a
+      # /questions hit then costs one query instead of three.
+      page = request.args.get("page", 1, type=int)
+      rows = (db.session.query(*_QUESTION_COLUMNS, func.count(Question.id).over())
+              .order_by(Question.id)
+              .limit(QUESTIONS_PER_PAGE)
+              .offset((page - 1) * QUESTIONS_PER_PAGE)
+              .all())
+      current_questions = [dict(zip(_QUESTION_FIELDS, row)) for row in rows]
+      total_questions = rows[0][-1] if rows else 0
+    else:
+      # The window count would only cover rows past the cursor, so the
+      # keyset path keeps a separate count.
+      selection = Question.query.order_by(Question.id)
+      current_questions = paginate_questions(request, selection)
+      total_questions = Question.query.count()
 
     if (len(current_questions) == 0):
       abort(404)
 
 
-    return jsonify(
+    return json_response(
         {
           "success": True,
           "questions": current_questions,
-          "totalQuestions": len(Question.query.all()),
+          "nextCursor": current_questions[-1]["id"] if current_questions else None,
+          "totalQuestions": total_questions,
           "categories": get_categories(),
         }
       )
 
   '''
-  @TODO: 
-  Create an endpoint to DELETE question using a question ID. 
+  @TODO:
+  Create an endpoint to DELETE question using a question ID.
 
   TEST: When you click the trash icon next to a question, the question will be removed.
   This removal will persist in the database and when you refresh the page. 
@@ -107,20 +207,20 @@ def create_app(test_config=None):
   @app.route("/questions/<int:question_id>", methods=["DELETE"])
   def delete_question(question_id):
       try:
-          question = Question.query.filter(Question.id == question_id).one_or_none()
-          
-          if question is None:
-              abort(404)
-          
-          question.delete()
-
-          return jsonify({
-            "success": True,
-          })
-
-      except:
+          deleted = Question.query.filter(Question.id == question_id).delete(
+              synchronize_session=False)
+          db.session.commit()
+      except SQLAlchemyError:
+          db.session.rollback()
           abort(422)
 
+      if deleted == 0:
+          abort(404)
+
+      return json_response({
+        "success": True,
+      })
+
   '''
   @TODO: 
   Create an endpoint to POST a new question, 
@@ -155,16 +255,28 @@ def create_app(test_config=None):
 
     try:
       if search:
-        selection = Question.query.order_by(Question.id).filter(Question.question.ilike("%{}%".format(search)))
-                
+        if request.args.get("fuzzy") and trgm_enabled():
+          # Typo-tolerant match behind an explicit flag. The %> operator
+          # (word_similarity over the threshold) is served by the trigram
+          # GIN index; a bare similarity() > x call would not be. Custom
+          # operators go into the SQL verbatim, so the percent is doubled
+          # to survive psycopg2's pyformat parameter interpolation.
+          score = func.word_similarity(search, Question.question)
+          selection = (Question.query
+                       .filter(Question.question.op("%%>")(search))
+                       .order_by(score.desc()))
+        else:
+          selection = Question.query.order_by(Question.id).filter(
+              Question.question.ilike("%{}%".format(escape_like(search)), escape="\\"))
+
         # selection = Book.query.order_by(Book.id).filter(or_(Book.title.ilike('%{}%'.format(search)), Book.author.ilike('%{}%'.format(search))))
         current_questions = paginate_questions(request, selection)
 
-        return jsonify({
+        return json_response({
                 "success": True,
                 "categories": get_categories(),
                 "questions": current_questions,
-                "totalQuestions": len(selection.all()),
+                "totalQuestions": selection.order_by(None).with_entities(func.count(Question.id)).scalar(),
                 })
 
       else:
@@ -174,21 +286,28 @@ def create_app(test_config=None):
         question = Question(question=new_question, difficulty=new_difficulty, category=new_category, answer=new_answer)
         question.insert()
 
-        selection = Question.query.order_by(Question.id).all()
-        current_questions = paginate_questions(request, selection)
+        # The new question lands at the end of the last page; fetch just
+        # that tail instead of re-paginating the whole table.
+        total = Question.query.count()
+        tail_size = total % QUESTIONS_PER_PAGE or QUESTIONS_PER_PAGE
+        tail = Question.query.order_by(Question.id.desc()).limit(tail_size).all()[::-1]
+        current_questions = [q.format() for q in tail]
 
-        return jsonify(
+        return json_response(
             {
               "success": True,
               "questions": current_questions,
-              "totalQuestions": len(Question.query.all()),
+              "totalQuestions": total,
               "categories": get_categories(),
               "questionID": question.id,
             }
           )
 
-    except:
+    except SQLAlchemyError:
+        db.session.rollback()
         abort(422)
+    except (KeyError, ValueError, TypeError):
+        abort(400)
 
   '''
   @TODO: 
@@ -201,7 +320,7 @@ def create_app(test_config=None):
 
   @app.route("/categories/<int:category_id>/questions")
   def get_questions_by_category(category_id):
-    selection = Question.query.filter(Question.category == category_id).all()
+    selection = Question.query.filter(Question.category == category_id).order_by(Question.id)
     current_questions = paginate_questions(request, selection)
 
     if (len(current_questions) == 0):
@@ -209,11 +328,11 @@ def create_app(test_config=None):
 
     category = Category.query.filter(Category.id == category_id).one_or_none().type
 
-    return jsonify({
+    return json_response({
           "currentCategory": category,
           "success": True,
           "questions": current_questions,
-          "totalQuestions": len(Question.query.all()),
+          "totalQuestions": Question.query.count(),
           "categories": get_categories(),
         })
 
@@ -238,26 +357,30 @@ def create_app(test_config=None):
             previous_questions = body['previous_questions']
 
             if not category == None:
-                if "previous_questions" in body and len(previous_questions) > 0:
-                    questions = Question.query.filter(Question.id.notin_(previous_questions), Question.category == category.id).all()
-                else:
-                    questions = Question.query.filter(Question.category == category.id).all()
+                selection = Question.query.filter(Question.category == category.id)
             else:
-                if "previous_questions" in body and len(previous_questions) > 0:
-                    questions = Question.query.filter(Question.id.notin_(previous_questions)).all()
-                else:
-                    questions = Question.query.all()
-            max = len(questions) -1
-            if max > 0:
-                question = questions[random.randint(0, max)].format()
+                selection = Question.query
+
+            if "previous_questions" in body and len(previous_questions) > 0:
+                # Bind the previous ids as one array parameter instead of a
+                # NOT IN (...) list that grows with every quiz turn.
+                prev_ids = cast(previous_questions, ARRAY(Integer))
+                selection = selection.filter(~Question.id.in_(select([func.unnest(prev_ids)])))
+
+            next_question = selection.order_by(func.random()).limit(1).first()
+            if next_question is not None:
+                question = next_question.format()
             else:
                 question = False
 
-            return jsonify({
+            return json_response({
               "success": True,
               "question": question
             })
-        except:
+        except SQLAlchemyError:
+            db.session.rollback()
+            abort(422)
+        except (KeyError, ValueError, TypeError):
             abort(400)
 
 
@@ -269,7 +392,7 @@ def create_app(test_config=None):
 
   @app.errorhandler(404)
   def not_found(error):
-    return jsonify({
+    return json_response({
     "success": False,
     "error": 404,
     "message": "Resource Not Found"
@@ -278,7 +401,7 @@ def create_app(test_config=None):
 
   @app.errorhandler(422)
   def unprocessable(error):
-    return jsonify({
+    return json_response({
     "success": False,
     "error": 422,
     "message": "unprocessable"
@@ -286,7 +409,7 @@ def create_app(test_config=None):
 
   @app.errorhandler(400)
   def not_found(error):
-    return jsonify({
+    return json_response({
     "success": False,
     "error": 4040,
     "message": "Bad Request"
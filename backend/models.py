@@ -18,6 +18,37 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    create_indexes()
+
+_TRGM_AVAILABLE = False
+
+'''
+trgm_enabled()
+    reports whether create_indexes managed to install the pg_trgm
+    extension; the fuzzy search path requires it
+'''
+def trgm_enabled():
+    return _TRGM_AVAILABLE
+
+'''
+create_indexes()
+    creates the trigram index used by the ILIKE question search and the
+    composite index used by the category-filtered endpoints; the trigram
+    index is skipped when the pg_trgm extension cannot be installed
+'''
+def create_indexes():
+    global _TRGM_AVAILABLE
+    db.engine.execute(
+        "CREATE INDEX IF NOT EXISTS ix_questions_category_id "
+        "ON questions (category, id)")
+    try:
+        db.engine.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        db.engine.execute(
+            "CREATE INDEX IF NOT EXISTS questions_question_trgm "
+            "ON questions USING gin (question gin_trgm_ops)")
+        _TRGM_AVAILABLE = True
+    except Exception:
+        db.session.rollback()
 
 '''
 Question
@@ -5,7 +5,7 @@ import json
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, Question, Category, trgm_enabled
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -39,6 +39,21 @@ class TriviaTestCase(unittest.TestCase):
         """Executed after reach test"""
         pass
 
+    def test_categories_not_modified(self):
+        """Tests /categories revalidation via ETag / If-None-Match"""
+
+        # first request returns the payload and an ETag
+        response = self.client().get('/categories')
+        etag = response.headers['ETag']
+
+        self.assertEqual(response.status_code, 200)
+
+        # revalidating with that ETag gets an empty 304
+        response = self.client().get(
+            '/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+
     def test_get_paginated_questions(self):
         """Tests question pagination success"""
 
@@ -64,6 +79,29 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Resource Not Found')
 
+    def test_cursor_pagination(self):
+        """Tests keyset pagination with an after_id cursor"""
+
+        # get the first page and the cursor it returns
+        response = self.client().get('/questions')
+        data = json.loads(response.data)
+
+        cursor = data['nextCursor']
+
+        # request the page after the cursor
+        response = self.client().get('/questions?after_id=' + str(cursor))
+        data = json.loads(response.data)
+
+        # check response content
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['questions']))
+        self.assertTrue(data['nextCursor'] > cursor)
+
+        # every returned question comes after the cursor
+        for question in data['questions']:
+            self.assertTrue(question['id'] > cursor)
+
     def test_delete_question(self):
         """Tests question deletion success"""
 
@@ -90,6 +128,18 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(questions_before) - len(questions_after) == 1)
         self.assertTrue(question == None)
 
+    def test_404_delete_nonexistent_question(self):
+        """Tests question deletion failure 404"""
+
+        # send delete request with an id that does not exist
+        response = self.client().delete('/questions/1000')
+        data = json.loads(response.data)
+
+        # check response content
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Resource Not Found')
+
     def test_create_new_question(self):
         """Tests question creation success"""
 
@@ -156,6 +206,39 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data['questions']), 0)
 
 
+    def test_search_escapes_like_wildcards(self):
+        """Tests that LIKE wildcards in a search term match literally"""
+
+        # an unescaped % would match every question; escaped, it only
+        # matches questions containing a literal % (none in the seed data)
+        response = self.client().post('/questions', json={'searchTerm': '%'})
+
+        # load response data
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['questions']), 0)
+
+    def test_fuzzy_search_questions(self):
+        """Tests fuzzy question search with a misspelled term"""
+
+        # fuzzy matching requires the pg_trgm extension
+        if not trgm_enabled():
+            self.skipTest('pg_trgm extension not available')
+
+        # send post request with a misspelled term and the fuzzy flag
+        response = self.client().post(
+            '/questions?fuzzy=1', json={'searchTerm': 'egyptions'})
+
+        # load response data
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['questions']))
+        self.assertEqual(data['questions'][0]['id'], 23)
+
     def test_get_questions_by_category(self):
         """Tests getting questions by category success"""
 